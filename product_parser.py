@@ -2,57 +2,209 @@
 # Product Parser — collects product data from website and saves to CSV
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
+try:
+    from requests_cache import CachedSession
+except ImportError:  # optional, only needed for use_cache=True
+    CachedSession = None
+from array import array
 import csv
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from datetime import datetime
+import heapq
+from operator import attrgetter
+import threading
 import time
+from urllib.parse import urljoin
+import math
 import os
+import re
+
+try:
+    import numpy as np
+except ImportError:  # optional, only speeds up statistics on large runs
+    np = None
+
+# CSS selectors, defined once instead of per product
+_SEL_PRODUCTS = "article.product_pod"
+_SEL_TITLE = "h3 a"
+_SEL_PRICE = ".price_color"
+_SEL_RATING = ".star-rating"
+_SEL_STOCK = ".availability"
+_SEL_IMAGE = ".thumbnail img"
+_SEL_DESCRIPTION = "#product_description ~ p"
+_SEL_UPC = "table tr:nth-child(1) td"
+
+# Numeric part of a price string like "£51.77" or "£1,234.50"
+_PRICE_RE = re.compile(r"(\d[\d,]*(?:\.\d+)?)")
+
+# Star rating class name -> number
+_RATINGS = {"Zero": 0, "One": 1, "Two": 2, "Three": 3, "Four": 4, "Five": 5}
+
+# Product count above which statistics are vectorized with NumPy
+_NUMPY_MIN_PRODUCTS = 10_000
+
+
+@dataclass(slots=True)
+class Product:
+    """Single product record (one CSV row)"""
+    title: str
+    price: str
+    price_value: float
+    rating: int
+    in_stock: bool
+    url: str | None
+    image_url: str | None
+    parsed_at: str
+
+
+# CSV columns and the matching row projection for Product
+_CSV_FIELDS = [field.name for field in fields(Product)]
+_CSV_ROW = attrgetter(*_CSV_FIELDS)
+
+
+class RateLimiter:
+    """Spaces out requests to a fixed rate, shared by all worker threads"""
+    
+    def __init__(self, rps):
+        self.interval = 1 / rps
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until the next request slot is available"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
 
 class ProductParser:
     """Parser for collecting product data from online store"""
     
-    def __init__(self):
+    def __init__(self, use_cache=False):
         self.base_url = "https://books.toscrape.com"
+        # Catalog pages live here; their links and images are relative to it
+        self._catalogue_base = self.base_url + "/catalogue/"
         self.products = []
+        # Column copies of the numeric fields for vectorized statistics
+        self._prices = array("d")
+        self._ratings = array("b")
+        self._in_stock = array("b")
+        # Set while parse_multiple_pages streams rows to a CSV file
+        self._csv_writer = None
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
+        
+        # One session for all requests — reuses keep-alive connections to the same host
+        if use_cache and CachedSession is None:
+            print("[WARNING] requests-cache is not installed, caching disabled")
+        if use_cache and CachedSession is not None:
+            # On-disk cache for reruns; expired pages are revalidated with ETag / Last-Modified
+            self.session = CachedSession(
+                "product_cache",
+                backend="sqlite",
+                expire_after=3600,
+                allowable_methods=["GET"],
+                cache_control=True,
+                stale_if_error=True,
+            )
+        else:
+            self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Transient failures are retried inside urllib3 with exponential backoff (0s, 1s, 2s, 4s)
+        retry = Retry(
+            total=4,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand back the last response; get_page checks the status
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Concurrent page fetches (must not exceed pool_maxsize), polite global rate
+        self.max_workers = 8
+        self.rate_limiter = RateLimiter(rps=2)
+    
+    def close(self):
+        """Close HTTP session and release pooled connections"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def clear_cache(self):
+        """Drop cached responses to force a fresh download"""
+        if hasattr(self.session, "cache"):
+            self.session.cache.clear()
+    
+    def _throttle(self, url):
+        """Wait for a rate limiter slot unless the page is served fresh from cache"""
+        cache = getattr(self.session, "cache", None)
+        if cache is not None:
+            # Expired entries still hit the network to revalidate, so only a fresh hit skips the limiter
+            request = self.session.prepare_request(requests.Request("GET", url))
+            cached = cache.get_response(cache.create_key(request))
+            if cached is not None and not cached.is_expired:
+                return
+        self.rate_limiter.acquire()
     
     def get_page(self, url):
         """Fetch page content"""
+        tree, error = self._fetch(url)
+        if error:
+            print(error)
+        return tree
+    
+    def _fetch(self, url):
+        """Fetch page, returning (tree, error message) instead of logging"""
+        self._throttle(url)
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
+            response = self.session.get(url, timeout=(3.05, 10))
         except requests.RequestException as e:
-            print(f"[ERROR] Failed to fetch {url}: {e}")
-            return None
+            # Only connection-level failures that outlived the retries end up here
+            return None, f"[ERROR] Failed to fetch {url}: {e}"
+        
+        if response.status_code >= 400:
+            return None, f"[ERROR] Failed to fetch {url}: HTTP {response.status_code}"
+        
+        # Raw bytes: Lexbor decodes in C, no intermediate str copy
+        return LexborHTMLParser(response.content), None
     
     def parse_rating(self, rating_class):
         """Convert rating class to number"""
-        ratings = {
-            "One": 1, "Two": 2, "Three": 3, "Four": 4, "Five": 5
-        }
-        return ratings.get(rating_class, 0)
+        return _RATINGS.get(rating_class, 0)
     
     def parse_product_page(self, url):
         """Parse individual product page for details"""
-        soup = self.get_page(url)
-        if not soup:
+        tree = self.get_page(url)
+        if tree is None:
             return None
         
         try:
             # Get product description
-            desc_tag = soup.select_one("#product_description ~ p")
-            description = desc_tag.text.strip() if desc_tag else "No description"
+            desc_tag = tree.css_first(_SEL_DESCRIPTION)
+            description = desc_tag.text().strip() if desc_tag else "No description"
             
             # Get stock info
-            stock_tag = soup.select_one(".availability")
-            stock = stock_tag.text.strip() if stock_tag else "Unknown"
+            stock_tag = tree.css_first(_SEL_STOCK)
+            stock = stock_tag.text().strip() if stock_tag else "Unknown"
             
             # Get UPC (unique product code)
-            upc_tag = soup.select_one("table tr:nth-child(1) td")
-            upc = upc_tag.text.strip() if upc_tag else "N/A"
+            upc_tag = tree.css_first(_SEL_UPC)
+            upc = upc_tag.text().strip() if upc_tag else "N/A"
             
             return {
                 "description": description[:200] + "..." if len(description) > 200 else description,
@@ -63,86 +215,128 @@ class ProductParser:
             print(f"[ERROR] Failed to parse product details: {e}")
             return None
     
+    def parse_product_pages(self, urls):
+        """Parse several product pages concurrently, keyed by URL"""
+        urls = list(urls)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(urls, executor.map(self.parse_product_page, urls)))
+    
+    def _fetch_catalog_tree(self, page_num):
+        """Fetch catalog page (safe to call from worker threads, errors are returned, not logged)"""
+        return self._fetch(f"{self._catalogue_base}page-{page_num}.html")
+    
     def parse_catalog_page(self, page_num=1):
         """Parse catalog page with product listings"""
-        if page_num == 1:
-            url = f"{self.base_url}/catalogue/page-{page_num}.html"
-        else:
-            url = f"{self.base_url}/catalogue/page-{page_num}.html"
-        
+        return self._parse_catalog_tree(self._fetch_catalog_tree(page_num), page_num)
+    
+    def _parse_catalog_tree(self, fetched, page_num):
+        """Extract products from fetched catalog page"""
+        tree, error = fetched
         print(f"\n[INFO] Parsing page {page_num}...")
-        soup = self.get_page(url)
         
-        if not soup:
+        if error:
+            print(error)
+        if tree is None:
             return False
         
-        products = soup.select("article.product_pod")
+        products = tree.css(_SEL_PRODUCTS)
         
         if not products:
             print("[INFO] No more products found")
             return False
         
+        parsed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         for product in products:
             try:
                 # Product title
-                title_tag = product.select_one("h3 a")
-                title = title_tag["title"] if title_tag else "Unknown"
+                title_tag = product.css_first(_SEL_TITLE)
+                title = title_tag.attrs["title"] if title_tag else "Unknown"
                 
                 # Product URL
-                product_url = self.base_url + "/catalogue/" + title_tag["href"].replace("../", "") if title_tag else None
+                product_url = urljoin(self._catalogue_base, title_tag.attrs["href"]) if title_tag else None
                 
                 # Price
-                price_tag = product.select_one(".price_color")
-                price = price_tag.text.strip() if price_tag else "N/A"
-                price_value = float(price.replace("£", "").replace("Â", "")) if price != "N/A" else 0
+                price_tag = product.css_first(_SEL_PRICE)
+                price = price_tag.text().strip() if price_tag else "N/A"
+                match = _PRICE_RE.search(price)
+                price_value = float(match.group(1).replace(",", "")) if match else 0.0
                 
                 # Rating
-                rating_tag = product.select_one(".star-rating")
-                rating_class = rating_tag["class"][1] if rating_tag else "Zero"
-                rating = self.parse_rating(rating_class)
+                rating_tag = product.css_first(_SEL_RATING)
+                rating_class = rating_tag.attrs.get("class", "").split(maxsplit=2)[1] if rating_tag else "Zero"
+                rating = _RATINGS.get(rating_class, 0)
                 
                 # Availability
-                stock_tag = product.select_one(".availability")
-                in_stock = "In stock" in stock_tag.text if stock_tag else False
+                stock_tag = product.css_first(_SEL_STOCK)
+                in_stock = stock_tag.text(deep=False).lstrip().startswith("In stock") if stock_tag else False
                 
                 # Image URL
-                img_tag = product.select_one(".thumbnail img")
-                image_url = self.base_url + "/" + img_tag["src"].replace("../", "") if img_tag else None
-                
-                product_data = {
-                    "title": title,
-                    "price": price,
-                    "price_value": price_value,
-                    "rating": rating,
-                    "in_stock": in_stock,
-                    "url": product_url,
-                    "image_url": image_url,
-                    "parsed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                self.products.append(product_data)
-                print(f"  ✓ {title[:50]}... — {price} — {'★' * rating}")
+                img_tag = product.css_first(_SEL_IMAGE)
+                image_url = urljoin(self._catalogue_base, img_tag.attrs["src"]) if img_tag else None
                 
+                product_data = Product(
+                    title=title,
+                    price=price,
+                    price_value=price_value,
+                    rating=rating,
+                    in_stock=in_stock,
+                    url=product_url,
+                    image_url=image_url,
+                    parsed_at=parsed_at
+                )
             except Exception as e:
                 print(f"[ERROR] Failed to parse product: {e}")
                 continue
+            
+            # Written before it is kept in memory; I/O errors propagate to the caller
+            if self._csv_writer:
+                self._csv_writer.writerow(_CSV_ROW(product_data))
+            self.products.append(product_data)
+            self._prices.append(price_value)
+            self._ratings.append(rating)
+            self._in_stock.append(in_stock)
+            print(f"  ✓ {title[:50]}... — {price} — {'★' * rating}")
         
         return True
     
-    def parse_multiple_pages(self, num_pages=3):
-        """Parse multiple catalog pages"""
+    def parse_multiple_pages(self, num_pages=3, filename=None):
+        """Parse multiple catalog pages, streaming rows to CSV if filename is given"""
         print("=" * 60)
         print("  PRODUCT PARSER by YohanDev")
         print("=" * 60)
         print(f"\n[START] Parsing {num_pages} pages from {self.base_url}")
         
-        for page in range(1, num_pages + 1):
-            success = self.parse_catalog_page(page)
-            if not success:
-                break
-            time.sleep(0.5)  # Polite delay between requests
+        start_count = len(self.products)
+        csv_file = None
+        if filename:
+            csv_file = open(filename, "w", newline="", encoding="utf-8")
+            self._csv_writer = csv.writer(csv_file)
+            self._csv_writer.writerow(_CSV_FIELDS)
+        
+        try:
+            pages = range(1, num_pages + 1)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Pages are fetched concurrently but parsed in order on this thread
+                for page, fetched in zip(pages, executor.map(self._fetch_catalog_tree, pages)):
+                    success = self._parse_catalog_tree(fetched, page)
+                    if csv_file:
+                        csv_file.flush()  # Finished pages survive a crash
+                    if not success:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+        finally:
+            if csv_file:
+                csv_file.close()
+                self._csv_writer = None
         
         print(f"\n[DONE] Total products collected: {len(self.products)}")
+        if csv_file:
+            if len(self.products) > start_count:
+                print(f"[SAVED] Data exported to: {filename}")
+            else:
+                # Don't leave a header-only file behind
+                os.remove(filename)
+                print("[WARNING] No products to save")
         return self.products
     
     def save_to_csv(self, filename=None):
@@ -155,13 +349,11 @@ class ProductParser:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"products_{timestamp}.csv"
         
-        fieldnames = ["title", "price", "price_value", "rating", "in_stock", "url", "image_url", "parsed_at"]
-        
         try:
-            with open(filename, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(self.products)
+            with open(filename, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+                writer = csv.writer(f)
+                writer.writerow(_CSV_FIELDS)
+                writer.writerows(_CSV_ROW(p) for p in self.products)
             
             print(f"\n[SAVED] Data exported to: {filename}")
             return filename
@@ -174,18 +366,46 @@ class ProductParser:
         if not self.products:
             return None
         
-        prices = [p["price_value"] for p in self.products if p["price_value"] > 0]
-        ratings = [p["rating"] for p in self.products]
-        in_stock = sum(1 for p in self.products if p["in_stock"])
+        total = len(self.products)
+        if np is not None and total >= _NUMPY_MIN_PRODUCTS and len(self._prices) == total:
+            # Zero-copy views over the column arrays, reduced in C
+            prices = np.frombuffer(self._prices, dtype=np.float64)
+            prices = prices[prices > 0]
+            in_stock = int(np.count_nonzero(np.frombuffer(self._in_stock, dtype=np.int8)))
+            rating_sum = int(np.frombuffer(self._ratings, dtype=np.int8).sum())
+            price_count = prices.size
+            price_sum = float(prices.sum())
+            min_price = float(prices.min()) if price_count else math.inf
+            max_price = float(prices.max()) if price_count else 0.0
+        else:
+            # Single pass: running totals instead of intermediate lists
+            in_stock = 0
+            rating_sum = 0
+            price_count = 0
+            price_sum = 0.0
+            min_price = math.inf
+            max_price = 0.0
+            for p in self.products:
+                rating_sum += p.rating
+                if p.in_stock:
+                    in_stock += 1
+                price_value = p.price_value
+                if price_value > 0:
+                    price_count += 1
+                    price_sum += price_value
+                    if price_value < min_price:
+                        min_price = price_value
+                    if price_value > max_price:
+                        max_price = price_value
         
         stats = {
-            "total_products": len(self.products),
+            "total_products": total,
             "in_stock": in_stock,
-            "out_of_stock": len(self.products) - in_stock,
-            "avg_price": round(sum(prices) / len(prices), 2) if prices else 0,
-            "min_price": min(prices) if prices else 0,
-            "max_price": max(prices) if prices else 0,
-            "avg_rating": round(sum(ratings) / len(ratings), 1) if ratings else 0
+            "out_of_stock": total - in_stock,
+            "avg_price": round(price_sum / price_count, 2) if price_count else 0,
+            "min_price": min_price if price_count else 0,
+            "max_price": max_price if price_count else 0,
+            "avg_rating": round(rating_sum / total, 1)
         }
         
         print("\n" + "=" * 60)
@@ -205,34 +425,32 @@ class ProductParser:
         """Find products with good rating and low price"""
         deals = [
             p for p in self.products 
-            if p["price_value"] <= max_price 
-            and p["rating"] >= min_rating 
-            and p["in_stock"]
+            if p.price_value <= max_price 
+            and p.rating >= min_rating 
+            and p.in_stock
         ]
         
         if deals:
             print(f"\n[DEALS] Best deals (under £{max_price}, {min_rating}+ stars):")
-            for deal in sorted(deals, key=lambda x: x["price_value"])[:5]:
-                print(f"  • {deal['title'][:40]}... — {deal['price']} — {'★' * deal['rating']}")
+            for deal in heapq.nsmallest(5, deals, key=attrgetter("price_value")):
+                print(f"  • {deal.title[:40]}... — {deal.price} — {'★' * deal.rating}")
         
         return deals
 
 
 def main():
     """Main function — run parser"""
-    parser = ProductParser()
-    
-    # Parse 3 pages of products
-    parser.parse_multiple_pages(num_pages=3)
-    
-    # Show statistics
-    parser.get_statistics()
-    
-    # Find best deals
-    parser.find_best_deals(max_price=15, min_rating=4)
-    
-    # Save to CSV
-    parser.save_to_csv()
+    # Session is closed even if parsing fails
+    with ProductParser() as parser:
+        # Parse 3 pages of products, writing each row to CSV as it is parsed
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        parser.parse_multiple_pages(num_pages=3, filename=f"products_{timestamp}.csv")
+        
+        # Show statistics
+        parser.get_statistics()
+        
+        # Find best deals
+        parser.find_best_deals(max_price=15, min_rating=4)
     
     print("\n[COMPLETE] Parser finished successfully!\n")
 